@@ -2,6 +2,24 @@ import numpy as np
 import math
 from typing import List, Tuple
 
+import numba as nb
+from scipy.spatial import cKDTree
+
+# Веса комбинированной метрики
+ANGLE_WEIGHT = 50.0  # вес для угла
+CENTER_WEIGHT = 0.5  # вес для расстояния между центрами
+LINE_WEIGHT = 1.0  # вес для расстояния между линиями
+
+# Поддерживаемые методы и их номера для ядер, получающих метод параметром (см. _frame_pair)
+_PARALLEL, _ANGLE, _CENTER, _COMBINED, _HAUSDORFF = range(5)
+_METHOD_IDS = {
+    'parallel': _PARALLEL,
+    'angle': _ANGLE,
+    'center': _CENTER,
+    'combined': _COMBINED,
+    'hausdorff': _HAUSDORFF,
+}
+
 def line_to_canonical(line: Tuple[float, float, float, float]) -> Tuple[float, float, float]:
     """
     Преобразует линию из формата двух точек в каноническую форму Ax + By + C = 0
@@ -10,7 +28,9 @@ def line_to_canonical(line: Tuple[float, float, float, float]) -> Tuple[float, f
     - line: кортеж (x1, y1, x2, y2)
     
     Возвращает:
-    - (A, B, C): коэффициенты канонического уравнения
+    - (A, B, C): коэффициенты канонического уравнения. Вырожденная линия
+      (точка) считается вертикальной прямой через эту точку: так же её угол
+      определяет line_angle (pi/2)
     """
     x1, y1, x2, y2 = line
     
@@ -25,6 +45,8 @@ def line_to_canonical(line: Tuple[float, float, float, float]) -> Tuple[float, f
         A /= norm
         B /= norm
         C /= norm
+    else:
+        A, B, C = 1.0, 0.0, -x1
     
     return A, B, C
 
@@ -34,14 +56,15 @@ def point_to_line_distance(point: Tuple[float, float], line: Tuple[float, float,
     
     Параметры:
     - point: кортеж (x, y)
-    - line: кортеж (A, B, C) канонического уравнения
+    - line: кортеж (A, B, C) канонического уравнения, нормализованный
+      так, что A^2 + B^2 = 1 (см. line_to_canonical)
     
     Возвращает:
     - distance: расстояние от точки до линии
     """
     x, y = point
     A, B, C = line
-    return abs(A * x + B * y + C) / math.sqrt(A**2 + B**2)
+    return abs(A * x + B * y + C)
 
 def line_center(line: Tuple[float, float, float, float]) -> Tuple[float, float]:
     """
@@ -133,9 +156,9 @@ def lines_distance(line1_canonical: Tuple[float, float, float],
         line_distance = (dist1_to_2 + dist2_to_1) / 2
         
         # Комбинированная метрика (можно настроить веса)
-        combined = (angle_diff * 50 +  # вес для угла
-                   center_distance * 0.5 +  # вес для расстояния между центрами
-                   line_distance * 1.0)  # вес для расстояния между линиями
+        combined = (angle_diff * ANGLE_WEIGHT +
+                   center_distance * CENTER_WEIGHT +
+                   line_distance * LINE_WEIGHT)
         
         return combined
     
@@ -148,90 +171,492 @@ def lines_distance(line1_canonical: Tuple[float, float, float],
         points1 = [(line1_points[0], line1_points[1]), (line1_points[2], line1_points[3])]
         points2 = [(line2_points[0], line2_points[1]), (line2_points[2], line2_points[3])]
         
-        # Вычисляем расстояние Хаусдорфа
-        max_min_dist = 0
-        for p1 in points1:
-            min_dist = min(point_to_line_distance(p1, line2_canonical) for p2 in points2)
-            max_min_dist = max(max_min_dist, min_dist)
-        
-        for p2 in points2:
-            min_dist = min(point_to_line_distance(p2, line1_canonical) for p1 in points1)
-            max_min_dist = max(max_min_dist, min_dist)
+        # Наибольшее из расстояний от концов каждой линии до другой линии
+        dist1_to_2 = max(point_to_line_distance(p1, line2_canonical) for p1 in points1)
+        dist2_to_1 = max(point_to_line_distance(p2, line1_canonical) for p2 in points2)
         
-        return max_min_dist
+        return max(dist1_to_2, dist2_to_1)
     
     else:
         raise ValueError(f"Неизвестный метод: {method}")
 
+def _as_soa(lines) -> np.ndarray:
+    """
+    Приводит линии к массиву формы (N, 4) типа float32, столбцы x1, y1, x2, y2
+    
+    Параметры:
+    - lines: список линий [(x1, y1, x2, y2), ...] или массив формы (N, 4)
+    """
+    return np.ascontiguousarray(np.asarray(lines, dtype=np.float32).reshape(-1, 4))
+
+def canonical_soa(P: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Канонические формы всех линий сразу (векторная версия line_to_canonical)
+    
+    Параметры:
+    - P: массив линий формы (N, 4)
+    
+    Возвращает:
+    - (A, B, C): массивы нормализованных коэффициентов длины N. Вырожденные
+      линии (точки), как и в line_to_canonical, - вертикальные прямые через эти точки
+    """
+    A = P[:, 3] - P[:, 1]
+    B = P[:, 0] - P[:, 2]
+    norm = np.hypot(A, B)
+    inv_norm = np.divide(1, norm, out=np.zeros_like(norm), where=norm > 0)
+    A = np.where(norm > 0, A * inv_norm, 1).astype(np.float32)
+    B = B * inv_norm
+    # C = x2*y1 - x1*y2, но считаем через уже нормализованные A, B,
+    # чтобы во float32 не вычитать друг из друга большие произведения
+    C = -(A * P[:, 0] + B * P[:, 1])
+    return A, B, C
+
+def angles_soa(A: np.ndarray, B: np.ndarray) -> np.ndarray:
+    """
+    Углы всех линий в радианах [0, pi) (векторная версия line_angle)
+    """
+    return np.arctan2(-A, B) % np.pi
+
+def lengths_soa(P: np.ndarray) -> np.ndarray:
+    """
+    Длины всех линий (векторная версия длины отрезка)
+    """
+    return np.hypot(P[:, 2] - P[:, 0], P[:, 3] - P[:, 1])
+
+def centers_soa(P: np.ndarray) -> np.ndarray:
+    """
+    Центры всех линий (векторная версия line_center)
+    
+    Возвращает:
+    - centers: массив центров формы (N, 2)
+    """
+    return 0.5 * (P[:, :2] + P[:, 2:])
+
+# fastmath без 'ninf' и 'nnan': метрика 'parallel' возвращает inf.
+# Без 'contract': с FMA суммы произведений вида A * x + B * y + C округляются
+# иначе, чем в canonical_soa, и расстояние от линии до самой себя реже равно 0
+_FASTMATH = {'nsz', 'arcp', 'afn', 'reassoc'}
+
+# Все ядра принимают одинаковый набор массивов (P, A, B, C, angles, cx, cy):
+# - P: линии формы (N, 4)
+# - A, B, C: нормализованные коэффициенты канонических форм
+# - angles: углы линий (см. angles_soa)
+# - cx, cy: координаты центров линий
+_ARRAYS = (nb.float32[:, :],) + (nb.float32[:],) * 6
+_MATRIX_SIGNATURE = nb.float32[:, :](*_ARRAYS, nb.float64)
+_EDGES_SIGNATURE = nb.types.Tuple((nb.intp[:], nb.intp[:], nb.float32[:]))(*_ARRAYS, nb.float64)
+
+@nb.njit(fastmath=_FASTMATH, cache=True, inline='always')
+def _parallel_pair(P, A, B, C, angles, cx, cy, i, j):
+    """
+    Расстояние между параллельными линиями i, j (см. lines_distance)
+    """
+    dot_product = abs(A[i] * A[j] + B[i] * B[j])
+    if dot_product < 0.95:
+        return np.inf
+    return abs(C[j] - C[i])
+
+@nb.njit(fastmath=_FASTMATH, cache=True, inline='always')
+def _angle_diff(angles, i, j):
+    """
+    Разница углов линий i, j в радианах [0, pi/2]
+    """
+    angle_diff = abs(angles[i] - angles[j])
+    if angle_diff > math.pi / 2:
+        angle_diff = math.pi - angle_diff
+    return angle_diff
+
+@nb.njit(fastmath=_FASTMATH, cache=True, inline='always')
+def _angle_pair(P, A, B, C, angles, cx, cy, i, j):
+    """
+    Угловое расстояние между линиями i, j (см. lines_distance)
+    """
+    return _angle_diff(angles, i, j) * 100
+
+@nb.njit(fastmath=_FASTMATH, cache=True, inline='always')
+def _center_pair(P, A, B, C, angles, cx, cy, i, j):
+    """
+    Расстояние между центрами линий i, j (см. lines_distance)
+    """
+    dx = cx[i] - cx[j]
+    dy = cy[i] - cy[j]
+    return math.sqrt(dx * dx + dy * dy)
+
+@nb.njit(fastmath=_FASTMATH, cache=True, inline='always')
+def _combined_pair(P, A, B, C, angles, cx, cy, i, j, threshold):
+    """
+    Комбинированная метрика для пары линий i, j (см. lines_distance).
+    Слагаемые считаются от дешёвого к дорогому; как только сумма заведомо
+    больше threshold, возвращается значение больше threshold (не обязательно точное).
+    """
+    distance = _angle_diff(angles, i, j) * ANGLE_WEIGHT
+    if distance > threshold:
+        return distance
+    
+    # Расстояние между центрами сравниваем с остатком порога в квадратах
+    dx = cx[i] - cx[j]
+    dy = cy[i] - cy[j]
+    center_sq = dx * dx + dy * dy
+    budget = threshold - distance
+    if center_sq * CENTER_WEIGHT * CENTER_WEIGHT > budget * budget:
+        return np.inf
+    distance += math.sqrt(center_sq) * CENTER_WEIGHT
+    
+    d1 = abs(A[j] * cx[i] + B[j] * cy[i] + C[j])
+    d2 = abs(A[i] * cx[j] + B[i] * cy[j] + C[i])
+    line_distance = (d1 + d2) / 2
+    
+    return distance + line_distance * LINE_WEIGHT
+
+@nb.njit(fastmath=_FASTMATH, cache=True, inline='always')
+def _hausdorff_pair(P, A, B, C, angles, cx, cy, i, j):
+    """
+    Расстояние Хаусдорфа между линиями i, j (см. lines_distance):
+    наибольшее из расстояний от концов одной линии до другой линии
+    """
+    return max(abs(A[j] * P[i, 0] + B[j] * P[i, 1] + C[j]),
+               abs(A[j] * P[i, 2] + B[j] * P[i, 3] + C[j]),
+               abs(A[i] * P[j, 0] + B[i] * P[j, 1] + C[i]),
+               abs(A[i] * P[j, 2] + B[i] * P[j, 3] + C[i]))
+
+@nb.njit(fastmath=_FASTMATH, cache=True, inline='always')
+def _n_lines(P, A, B, C, angles, cx, cy):
+    """
+    Проверяет согласованность размеров массивов и возвращает число линий
+    """
+    n = A.shape[0]
+    assert P.shape[0] == n and P.shape[1] == 4
+    assert B.shape[0] == n and C.shape[0] == n and angles.shape[0] == n
+    assert cx.shape[0] == n and cy.shape[0] == n
+    return n
+
+# Матричные ядра: строка i считает только j > i и пишет оба элемента out[i, j] и out[j, i]
+@nb.njit(_MATRIX_SIGNATURE, fastmath=_FASTMATH, parallel=True, cache=True)
+def _angle_matrix(P, A, B, C, angles, cx, cy, threshold):
+    n = _n_lines(P, A, B, C, angles, cx, cy)
+    out = np.empty((n, n), np.float32)
+    for i in nb.prange(n):
+        out[i, i] = 0.0
+        for j in range(i + 1, n):
+            out[i, j] = out[j, i] = _angle_pair(P, A, B, C, angles, cx, cy, i, j)
+    return out
+
+@nb.njit(_MATRIX_SIGNATURE, fastmath=_FASTMATH, parallel=True, cache=True)
+def _center_matrix(P, A, B, C, angles, cx, cy, threshold):
+    n = _n_lines(P, A, B, C, angles, cx, cy)
+    out = np.empty((n, n), np.float32)
+    for i in nb.prange(n):
+        out[i, i] = 0.0
+        for j in range(i + 1, n):
+            out[i, j] = out[j, i] = _center_pair(P, A, B, C, angles, cx, cy, i, j)
+    return out
+
+@nb.njit(_MATRIX_SIGNATURE, fastmath=_FASTMATH, parallel=True, cache=True)
+def _combined_matrix(P, A, B, C, angles, cx, cy, threshold):
+    n = _n_lines(P, A, B, C, angles, cx, cy)
+    out = np.empty((n, n), np.float32)
+    for i in nb.prange(n):
+        out[i, i] = 0.0
+        for j in range(i + 1, n):
+            out[i, j] = out[j, i] = _combined_pair(P, A, B, C, angles, cx, cy, i, j, threshold)
+    return out
+
+@nb.njit(_MATRIX_SIGNATURE, fastmath=_FASTMATH, parallel=True, cache=True)
+def _hausdorff_matrix(P, A, B, C, angles, cx, cy, threshold):
+    n = _n_lines(P, A, B, C, angles, cx, cy)
+    out = np.empty((n, n), np.float32)
+    for i in nb.prange(n):
+        out[i, i] = 0.0
+        for j in range(i + 1, n):
+            out[i, j] = out[j, i] = _hausdorff_pair(P, A, B, C, angles, cx, cy, i, j)
+    return out
+
+# Отдельное ядро для каждого метода, чтобы во внутреннем цикле не было ветвления по method.
+# Пары с расстоянием больше threshold могут получить inf.
+# Для 'parallel' ядра нет: матрица считается через BLAS (см. calculate_line_distances).
+_MATRIX_KERNELS = {
+    'angle': _angle_matrix,
+    'center': _center_matrix,
+    'combined': _combined_matrix,
+    'hausdorff': _hausdorff_matrix,
+}
+
+@nb.njit(nb.float32[:](*_ARRAYS, nb.intp[:], nb.intp[:], nb.float64),
+         fastmath=_FASTMATH, parallel=True, cache=True)
+def _combined_pairs(P, A, B, C, angles, cx, cy, i_idx, j_idx, threshold):
+    """
+    Комбинированная метрика только для заданных пар линий (i_idx[k], j_idx[k])
+    
+    Возвращает:
+    - out: массив расстояний длины len(i_idx) (float32); для пар с расстоянием
+      больше threshold - какое-то значение больше threshold (не обязательно точное)
+    """
+    _n_lines(P, A, B, C, angles, cx, cy)
+    m = i_idx.shape[0]
+    assert j_idx.shape[0] == m
+    
+    out = np.empty(m, np.float32)
+    for k in nb.prange(m):
+        out[k] = _combined_pair(P, A, B, C, angles, cx, cy, i_idx[k], j_idx[k], threshold)
+    
+    return out
+
+@nb.njit(_EDGES_SIGNATURE, fastmath=_FASTMATH, parallel=True, cache=True)
+def _parallel_edges(P, A, B, C, angles, cx, cy, threshold):
+    n = _n_lines(P, A, B, C, angles, cx, cy)
+    
+    # Первый проход: сколько похожих пар начинается в каждой строке
+    counts = np.zeros(n + 1, np.intp)
+    for i in nb.prange(n):
+        for j in range(i + 1, n):
+            if _parallel_pair(P, A, B, C, angles, cx, cy, i, j) <= threshold:
+                counts[i + 1] += 1
+    offsets = np.cumsum(counts)
+    
+    # Второй проход: каждая строка пишет свои пары в свой отрезок массивов
+    i_idx = np.empty(offsets[n], np.intp)
+    j_idx = np.empty(offsets[n], np.intp)
+    distances = np.empty(offsets[n], np.float32)
+    for i in nb.prange(n):
+        k = offsets[i]
+        for j in range(i + 1, n):
+            distance = _parallel_pair(P, A, B, C, angles, cx, cy, i, j)
+            if distance <= threshold:
+                i_idx[k] = i
+                j_idx[k] = j
+                distances[k] = distance
+                k += 1
+    return i_idx, j_idx, distances
+
+@nb.njit(_EDGES_SIGNATURE, fastmath=_FASTMATH, parallel=True, cache=True)
+def _angle_edges(P, A, B, C, angles, cx, cy, threshold):
+    n = _n_lines(P, A, B, C, angles, cx, cy)
+    
+    # Первый проход: сколько похожих пар начинается в каждой строке
+    counts = np.zeros(n + 1, np.intp)
+    for i in nb.prange(n):
+        for j in range(i + 1, n):
+            if _angle_pair(P, A, B, C, angles, cx, cy, i, j) <= threshold:
+                counts[i + 1] += 1
+    offsets = np.cumsum(counts)
+    
+    # Второй проход: каждая строка пишет свои пары в свой отрезок массивов
+    i_idx = np.empty(offsets[n], np.intp)
+    j_idx = np.empty(offsets[n], np.intp)
+    distances = np.empty(offsets[n], np.float32)
+    for i in nb.prange(n):
+        k = offsets[i]
+        for j in range(i + 1, n):
+            distance = _angle_pair(P, A, B, C, angles, cx, cy, i, j)
+            if distance <= threshold:
+                i_idx[k] = i
+                j_idx[k] = j
+                distances[k] = distance
+                k += 1
+    return i_idx, j_idx, distances
+
+@nb.njit(_EDGES_SIGNATURE, fastmath=_FASTMATH, parallel=True, cache=True)
+def _hausdorff_edges(P, A, B, C, angles, cx, cy, threshold):
+    n = _n_lines(P, A, B, C, angles, cx, cy)
+    
+    # Первый проход: сколько похожих пар начинается в каждой строке
+    counts = np.zeros(n + 1, np.intp)
+    for i in nb.prange(n):
+        for j in range(i + 1, n):
+            if _hausdorff_pair(P, A, B, C, angles, cx, cy, i, j) <= threshold:
+                counts[i + 1] += 1
+    offsets = np.cumsum(counts)
+    
+    # Второй проход: каждая строка пишет свои пары в свой отрезок массивов
+    i_idx = np.empty(offsets[n], np.intp)
+    j_idx = np.empty(offsets[n], np.intp)
+    distances = np.empty(offsets[n], np.float32)
+    for i in nb.prange(n):
+        k = offsets[i]
+        for j in range(i + 1, n):
+            distance = _hausdorff_pair(P, A, B, C, angles, cx, cy, i, j)
+            if distance <= threshold:
+                i_idx[k] = i
+                j_idx[k] = j
+                distances[k] = distance
+                k += 1
+    return i_idx, j_idx, distances
+
+# Ядра, которые сразу выдают пары (i < j) с расстоянием не больше threshold,
+# не создавая ни матрицы N x N, ни списка всех пар. Для 'combined' и 'center'
+# кандидатов заранее отбирает KD-дерево (см. _similar_pairs)
+_EDGE_KERNELS = {
+    'parallel': _parallel_edges,
+    'angle': _angle_edges,
+    'hausdorff': _hausdorff_edges,
+}
+
+def _line_arrays(P: np.ndarray, centers: np.ndarray) -> tuple:
+    """
+    Набор массивов (P, A, B, C, angles, cx, cy), который принимают ядра
+    
+    Параметры:
+    - P: массив линий формы (N, 4)
+    - centers: центры линий формы (N, 2) (см. centers_soa)
+    """
+    A, B, C = canonical_soa(P)
+    cx, cy = np.ascontiguousarray(centers.T)
+    return (P, A, B, C, angles_soa(A, B), cx, cy)
+
 def calculate_line_distances(lines: List[Tuple[float, float, float, float]], 
-                           method: str = 'combined') -> np.ndarray:
+                           method: str = 'combined',
+                           threshold: float = np.inf) -> np.ndarray:
     """
     Вычисляет матрицу попарных расстояний между линиями
     
     Параметры:
-    - lines: список линий в формате [(x1, y1, x2, y2), ...]
+    - lines: список линий в формате [(x1, y1, x2, y2), ...] или массив формы (N, 4)
     - method: метод вычисления расстояния
+    - threshold: если задан, расстояния больше порога могут быть посчитаны
+      не до конца: гарантируется лишь, что значение тоже больше порога.
+      Для метода 'parallel' порог не используется
     
     Возвращает:
-    - distance_matrix: матрица N x N расстояний между линиями
+    - distance_matrix: матрица N x N расстояний между линиями (float32)
+    """
+    if method not in _METHOD_IDS:
+        raise ValueError(f"Неизвестный метод: {method}")
+    
+    P = _as_soa(lines)
+    
+    if method == 'parallel':
+        # Скалярные произведения нормалей всех пар - одно матричное умножение (BLAS)
+        A, B, C = canonical_soa(P)
+        normals = np.column_stack([A, B])
+        dot_product = np.abs(normals @ normals.T)
+        distance_matrix = np.where(dot_product < 0.95, np.inf, np.abs(C[:, None] - C[None, :]))
+        np.fill_diagonal(distance_matrix, 0)
+        return distance_matrix
+    
+    return _MATRIX_KERNELS[method](*_line_arrays(P, centers_soa(P)), threshold)
+
+def _union_find_groups(n: int, i_idx: np.ndarray, j_idx: np.ndarray) -> List[List[int]]:
     """
-    n = len(lines)
-    distance_matrix = np.zeros((n, n))
+    Объединяет линии в группы по списку пар (система непересекающихся множеств)
+    
+    Параметры:
+    - n: количество линий
+    - i_idx, j_idx: индексы пар похожих линий
     
-    # Преобразуем все линии в каноническую форму
-    canonical_lines = [line_to_canonical(line) for line in lines]
+    Возвращает:
+    - groups: список групп индексов, упорядоченных по первому элементу
+    """
+    parent = list(range(n))
+    rank = [0] * n
     
-    # Вычисляем попарные расстояния
+    def find(x):
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        # Сжатие путей
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+    
+    def union(a, b):
+        a, b = find(a), find(b)
+        if a == b:
+            return
+        # Объединение по рангу
+        if rank[a] < rank[b]:
+            a, b = b, a
+        parent[b] = a
+        if rank[a] == rank[b]:
+            rank[a] += 1
+    
+    for a, b in zip(i_idx.tolist(), j_idx.tolist()):
+        union(a, b)
+    
+    groups = {}
     for i in range(n):
-        for j in range(i + 1, n):
-            distance = lines_distance(
-                canonical_lines[i], 
-                canonical_lines[j],
-                lines[i] if method in ['center', 'combined', 'hausdorff'] else None,
-                lines[j] if method in ['center', 'combined', 'hausdorff'] else None,
-                method
-            )
-            distance_matrix[i, j] = distance
-            distance_matrix[j, i] = distance
-    
-    return distance_matrix
+        groups.setdefault(find(i), []).append(i)
+    
+    return list(groups.values())
+
+def _similar_pairs(P: np.ndarray, threshold: float,
+                   method: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Находит все пары линий (i < j), расстояние между которыми не превышает порог
+    
+    Параметры:
+    - P: массив линий формы (N, 4) (см. _as_soa)
+    - threshold: порог для определения похожести
+    - method: метод вычисления расстояния
+    
+    Возвращает:
+    - (i_idx, j_idx, distances): индексы пар и расстояния между ними
+    """
+    if method not in _METHOD_IDS:
+        raise ValueError(f"Неизвестный метод: {method}")
+    
+    # Центры считаются один раз: по ним строится KD-дерево, их же получают ядра
+    centers = centers_soa(P)
+    arrays = _line_arrays(P, centers)
+    
+    if method in _EDGE_KERNELS:
+        return _EDGE_KERNELS[method](*arrays, threshold)
+    
+    # Метрики 'combined' и 'center' не меньше (взвешенного) расстояния между центрами,
+    # поэтому кандидатов достаточно искать KD-деревом в радиусе порога
+    cx, cy = arrays[-2:]
+    radius = threshold / CENTER_WEIGHT if method == 'combined' else threshold
+    pairs = cKDTree(centers).query_pairs(r=radius, output_type='ndarray')
+    i_idx, j_idx = pairs[:, 0], pairs[:, 1]
+    
+    if method == 'center':
+        # Сравниваем квадраты, корни извлекаем только для прошедших порог пар
+        center_sq = (cx[i_idx] - cx[j_idx]) ** 2 + (cy[i_idx] - cy[j_idx]) ** 2
+        similar = center_sq <= threshold ** 2
+        return i_idx[similar], j_idx[similar], np.sqrt(center_sq[similar])
+    
+    distances = _combined_pairs(*arrays, i_idx, j_idx, threshold)
+    similar = distances <= threshold
+    
+    return i_idx[similar], j_idx[similar], distances[similar]
 
 def find_similar_lines(lines: List[Tuple[float, float, float, float]], 
                       threshold: float = 10.0,
                       method: str = 'combined') -> List[List[int]]:
     """
-    Находит группы похожих линий на основе матрицы расстояний
+    Находит группы похожих линий, расстояние между которыми не превышает порог.
+    Похожесть транзитивна: если a похожа на b, а b на c, то все три
+    попадают в одну группу.
     
     Параметры:
-    - lines: список линий
+    - lines: список линий или массив формы (N, 4)
     - threshold: порог для определения похожести
     - method: метод вычисления расстояния
     
     Возвращает:
     - groups: список групп индексов похожих линий
     """
-    distance_matrix = calculate_line_distances(lines, method)
-    n = len(lines)
-    visited = set()
-    groups = []
+    P = _as_soa(lines)
+    i_idx, j_idx, _ = _similar_pairs(P, threshold, method)
     
-    for i in range(n):
-        if i in visited:
-            continue
-        
-        # Начинаем новую группу с линии i
-        group = [i]
-        visited.add(i)
-        
-        # Ищем все линии, близкие к текущей группе
-        for j in range(n):
-            if j not in visited and distance_matrix[i, j] <= threshold:
-                group.append(j)
-                visited.add(j)
-        
-        groups.append(group)
+    return _union_find_groups(len(P), i_idx, j_idx)
+
+def _select_lines(lines, P: np.ndarray, groups: List[List[int]], keep_longest: bool) -> list:
+    """
+    Выбирает по одной линии из каждой группы (см. remove_similar_lines)
+    """
+    unique_lines = []
     
-    return groups
+    if keep_longest:
+        # Оставляем самую длинную линию в группе
+        lengths = lengths_soa(P)
+        for group in groups:
+            unique_lines.append(lines[group[np.argmax(lengths[group])]])
+    else:
+        # Оставляем первую линию в группе
+        for group in groups:
+            unique_lines.append(lines[group[0]])
+    
+    return unique_lines
 
 def remove_similar_lines(lines: List[Tuple[float, float, float, float]], 
                         threshold: float = 10.0,
@@ -249,20 +674,199 @@ def remove_similar_lines(lines: List[Tuple[float, float, float, float]],
     Возвращает:
     - unique_lines: список уникальных линий
     """
-    def line_length(line):
-        x1, y1, x2, y2 = line
-        return math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
+    P = _as_soa(lines)
+    groups = find_similar_lines(P, threshold, method)
     
-    groups = find_similar_lines(lines, threshold, method)
-    unique_lines = []
+    return _select_lines(lines, P, groups, keep_longest)
+
+class LineSimilarityIndex:
+    """
+    Индекс для подбора порога: расстояния между линиями считаются один раз,
+    после чего группы для любого порога не больше max_threshold строятся
+    одним проходом по отсортированному списку пар
     
-    for group in groups:
-        if keep_longest:
-            # Оставляем самую длинную линию в группе
-            longest_line = max([lines[i] for i in group], key=line_length)
-            unique_lines.append(longest_line)
-        else:
-            # Оставляем первую линию в группе
-            unique_lines.append(lines[group[0]])
+    Пример:
+    >>> index = LineSimilarityIndex(lines, method='combined', max_threshold=50)
+    >>> for threshold in (5, 10, 20):
+    ...     print(threshold, len(index.remove_similar_lines(threshold)))
+    """
+    
+    def __init__(self, lines: List[Tuple[float, float, float, float]],
+                 method: str = 'combined',
+                 *, max_threshold: float):
+        """
+        Параметры:
+        - lines: список линий или массив формы (N, 4)
+        - method: метод вычисления расстояния
+        - max_threshold: наибольший порог, для которого понадобятся группы;
+          чем он меньше, тем меньше пар хранит индекс. Должен быть конечным:
+          при бесконечном пороге индекс хранил бы все N*(N-1)/2 пар
+        """
+        if not np.isfinite(max_threshold):
+            raise ValueError(f"max_threshold должен быть конечным, получено {max_threshold}")
+        
+        self.lines = lines
+        self.method = method
+        self.max_threshold = max_threshold
+        self._P = _as_soa(lines)
+        
+        i_idx, j_idx, distances = _similar_pairs(self._P, max_threshold, method)
+        order = np.argsort(distances, kind='stable')
+        # Пары (i, j) в порядке возрастания расстояния между линиями
+        self.edges = np.column_stack([i_idx[order], j_idx[order]])
+        self.distances = distances[order]
+    
+    def find_similar_lines(self, threshold: float) -> List[List[int]]:
+        """
+        Группы похожих линий для порога threshold (см. find_similar_lines)
+        """
+        if threshold > self.max_threshold:
+            raise ValueError(f"Порог {threshold} больше max_threshold={self.max_threshold}")
+        
+        k = np.searchsorted(self.distances, threshold, side='right')
+        return _union_find_groups(len(self._P), self.edges[:k, 0], self.edges[:k, 1])
+    
+    def remove_similar_lines(self, threshold: float,
+                             keep_longest: bool = True) -> List[Tuple[float, float, float, float]]:
+        """
+        Уникальные линии для порога threshold (см. remove_similar_lines)
+        """
+        groups = self.find_similar_lines(threshold)
+        return _select_lines(self.lines, self._P, groups, keep_longest)
+
+@nb.njit(fastmath=_FASTMATH, cache=True, inline='always')
+def _frame_pair(method_id, P, A, B, C, angles, cx, cy, i, j, threshold):
+    """
+    Расстояние между линиями i, j методом с номером method_id (см. _METHOD_IDS).
+    Ветвление по method_id остаётся во внутреннем цикле, но за вызов ядра
+    оно не меняется и поэтому хорошо предсказывается процессором
+    """
+    if method_id == _PARALLEL:
+        return _parallel_pair(P, A, B, C, angles, cx, cy, i, j)
+    if method_id == _ANGLE:
+        return _angle_pair(P, A, B, C, angles, cx, cy, i, j)
+    if method_id == _CENTER:
+        return _center_pair(P, A, B, C, angles, cx, cy, i, j)
+    if method_id == _COMBINED:
+        return _combined_pair(P, A, B, C, angles, cx, cy, i, j, threshold)
+    if method_id == _HAUSDORFF:
+        return _hausdorff_pair(P, A, B, C, angles, cx, cy, i, j)
+    # Недостижимо: номер метода проверяется в _frames_unique
+    return np.inf
+
+@nb.njit(cache=True, inline='always')
+def _find(parent, x):
+    """
+    Корень множества x (со сжатием путей делением пополам)
+    """
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+@nb.njit(cache=True, inline='always')
+def _union(parent, rank, a, b):
+    """
+    Объединяет множества a и b по рангу
+    """
+    a = _find(parent, a)
+    b = _find(parent, b)
+    if a == b:
+        return
+    if rank[a] < rank[b]:
+        a, b = b, a
+    parent[b] = a
+    if rank[a] == rank[b]:
+        rank[a] += 1
+
+@nb.njit(nb.types.Tuple((nb.intp[:], nb.intp[:]))(nb.intp, *_ARRAYS, nb.float32[:],
+                                                  nb.intp[:], nb.float64, nb.boolean),
+         fastmath=_FASTMATH, parallel=True, cache=True)
+def _frames_unique(method_id, P, A, B, C, angles, cx, cy, lengths, offsets, threshold, keep_longest):
+    """
+    Удаляет похожие линии сразу во всех кадрах; линии кадра f занимают
+    индексы offsets[f]:offsets[f + 1] во всех массивах
+    
+    Возвращает:
+    - (selected, counts): номера оставленных линий кадра f лежат в
+      selected[offsets[f]:offsets[f] + counts[f]] в порядке групп
+      (как в remove_similar_lines)
+    """
+    assert (method_id == _PARALLEL or method_id == _ANGLE or method_id == _CENTER or
+            method_id == _COMBINED or method_id == _HAUSDORFF)
+    total = _n_lines(P, A, B, C, angles, cx, cy)
+    assert lengths.shape[0] == total and offsets[-1] == total
+    n_frames = offsets.shape[0] - 1
+    
+    parent = np.arange(total)
+    rank = np.zeros(total, np.intp)
+    first = np.full(total, -1, np.intp)
+    best = np.empty(total, np.intp)
+    selected = np.empty(total, np.intp)
+    counts = np.zeros(n_frames, np.intp)
+    
+    # Кадры не пересекаются по индексам, поэтому обрабатываются параллельно
+    for f in nb.prange(n_frames):
+        start = offsets[f]
+        end = offsets[f + 1]
+        
+        for i in range(start, end):
+            for j in range(i + 1, end):
+                if _frame_pair(method_id, P, A, B, C, angles, cx, cy, i, j, threshold) <= threshold:
+                    _union(parent, rank, i, j)
+        
+        # Первая и самая длинная линия каждой группы
+        for i in range(start, end):
+            root = _find(parent, i)
+            if first[root] < 0:
+                first[root] = i
+                best[root] = i
+            elif keep_longest and lengths[i] > lengths[best[root]]:
+                best[root] = i
+        
+        count = 0
+        for i in range(start, end):
+            root = _find(parent, i)
+            if first[root] == i:
+                selected[start + count] = best[root]
+                count += 1
+        counts[f] = count
+    
+    return selected, counts
+
+def remove_similar_lines_batch(frames: List[List[Tuple[float, float, float, float]]],
+                               threshold: float = 10.0,
+                               method: str = 'combined',
+                               keep_longest: bool = True) -> List[List[Tuple[float, float, float, float]]]:
+    """
+    Удаляет похожие линии в каждом кадре (например, в кадрах видео) за один
+    вызов ядра; результат тот же, что у remove_similar_lines для каждого кадра
+    
+    Параметры:
+    - frames: список кадров, каждый - список линий или массив формы (N, 4)
+    - threshold: порог для определения похожести
+    - method: метод вычисления расстояния
+    - keep_longest: если True, оставляет самую длинную линию в группе
+    
+    Возвращает:
+    - unique_lines: для каждого кадра список уникальных линий
+    """
+    if method not in _METHOD_IDS:
+        raise ValueError(f"Неизвестный метод: {method}")
+    if not frames:
+        return []
+    
+    # Все кадры подряд в одном массиве, кадр f занимает строки offsets[f]:offsets[f + 1]
+    Ps = [_as_soa(lines) for lines in frames]
+    offsets = np.zeros(len(Ps) + 1, np.intp)
+    np.cumsum([len(P) for P in Ps], out=offsets[1:])
+    P = np.concatenate(Ps)
+    
+    selected, counts = _frames_unique(_METHOD_IDS[method], *_line_arrays(P, centers_soa(P)),
+                                      lengths_soa(P), offsets, threshold, keep_longest)
+    
+    unique_lines = []
+    for lines, start, count in zip(frames, offsets, counts):
+        unique_lines.append([lines[k - start] for k in selected[start:start + count]])
     
-    return unique_lines
\ No newline at end of file
+    return unique_lines